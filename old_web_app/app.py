@@ -5,15 +5,23 @@ Beautiful, elegant web app for processing receipt images
 """
 
 import os
-import json
 import csv
 import io
+import itertools
+import tempfile
+import threading
 import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for
+import orjson
+from flask import Flask, render_template, request, jsonify, send_file, send_from_directory, flash, redirect, url_for
 from werkzeug.utils import secure_filename
 from textractprettyprinter.t_pretty_print_expense import get_string
 from textractprettyprinter.t_pretty_print_expense import Textract_Expense_Pretty_Print, Pretty_Print_Table_Format
+from extract import extract_receipt_fields
+from uring_writer import UringBatchWriter
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'
@@ -22,53 +30,87 @@ app.secret_key = 'your_secret_key_here'
 UPLOAD_FOLDER = 'web_uploads'
 OUTPUT_FOLDER = 'web_output'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'tiff', 'tif', 'pdf'}
+ZIP_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# Separator between the header and the pretty printed tables in *-response.txt
+_SEP_BYTES = b'=' * 50 + b'\n\n'
+
+_ALLOWED_SUFFIXES = tuple('.' + ext for ext in ALLOWED_EXTENSIONS)
+
+# Path separators, shell/Windows-reserved characters, whitespace and control characters
+_FILENAME_TABLE = str.maketrans({c: '_' for c in '\\/:*?"<>| ' + ''.join(map(chr, range(32))) + '\x7f'})
 
 # Create directories if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# Fields extracted from raw JSON outputs: path -> ((mtime_ns, size), fields)
+_JSON_EXTRACT_CACHE = {}
+
+# CSV rows for every processed receipt: base name -> (summary_row, detail_rows)
+_RECEIPT_ROWS = {}
+_RECEIPT_ROWS_LOCK = threading.Lock()
+
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def create_mock_textract_response(filename):
-    """Create mock textract response with varied data for demo"""
-    vendors = [
-        "COFFEE SHOP DOWNTOWN", "WALMART SUPERCENTER", "TARGET STORE",
-        "STARBUCKS COFFEE", "AMAZON.COM", "BEST BUY"
-    ]
-    items = [
-        [("Large Coffee", "$4.50"), ("Blueberry Muffin", "$3.25")],
-        [("Groceries", "$45.67"), ("Milk", "$3.99"), ("Bread", "$2.49")],
-        [("Office Supplies", "$23.45"), ("Notebook", "$5.99")],
-        [("Cappuccino", "$5.25"), ("Croissant", "$4.75")],
-        [("Electronics", "$129.99"), ("USB Cable", "$12.99")],
-        [("Software", "$89.99")]
-    ]
-
-    # Use filename to create some variation
-    vendor_idx = hash(filename) % len(vendors)
-    items_idx = hash(filename) % len(items)
-
-    selected_vendor = vendors[vendor_idx]
-    selected_items = items[items_idx]
-
-    # Calculate total
-    total = sum(float(price.replace('$', '')) for _, price in selected_items)
-
-    line_items = []
-    for item_name, item_price in selected_items:
-        line_items.append({
-            "LineItemExpenseFields": [
-                {
-                    "Type": {"Text": "ITEM", "Confidence": 99.5},
-                    "ValueDetection": {"Text": item_name, "Confidence": 99.5}
-                },
-                {
-                    "Type": {"Text": "PRICE", "Confidence": 99.8},
-                    "ValueDetection": {"Text": item_price, "Confidence": 99.8}
-                }
-            ]
-        })
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
+
+def fast_safe_name(filename):
+    """Make an uploaded filename safe to store, without werkzeug's regex passes for ASCII names"""
+    if not filename.isascii():
+        return secure_filename(filename)
+    return filename.translate(_FILENAME_TABLE).lstrip('._') or 'upload'
+
+# Demo data for the mock Textract responses (vendor i pairs with item set i)
+_MOCK_VENDORS = [
+    "COFFEE SHOP DOWNTOWN", "WALMART SUPERCENTER", "TARGET STORE",
+    "STARBUCKS COFFEE", "AMAZON.COM", "BEST BUY"
+]
+_MOCK_ITEMS = [
+    [("Large Coffee", "$4.50"), ("Blueberry Muffin", "$3.25")],
+    [("Groceries", "$45.67"), ("Milk", "$3.99"), ("Bread", "$2.49")],
+    [("Office Supplies", "$23.45"), ("Notebook", "$5.99")],
+    [("Cappuccino", "$5.25"), ("Croissant", "$4.75")],
+    [("Electronics", "$129.99"), ("USB Cable", "$12.99")],
+    [("Software", "$89.99")]
+]
+
+def _build_line_items(selected_items):
+    return [{
+        "LineItemExpenseFields": [
+            {
+                "Type": {"Text": "ITEM", "Confidence": 99.5},
+                "ValueDetection": {"Text": item_name, "Confidence": 99.5}
+            },
+            {
+                "Type": {"Text": "PRICE", "Confidence": 99.8},
+                "ValueDetection": {"Text": item_price, "Confidence": 99.8}
+            }
+        ]
+    } for item_name, item_price in selected_items]
+
+# Line items and totals are constant per item set, so build them once
+_LINE_ITEM_TEMPLATES = [_build_line_items(selected_items) for selected_items in _MOCK_ITEMS]
+_MOCK_TOTALS = [sum(float(price.replace('$', '')) for _, price in selected_items)
+                for selected_items in _MOCK_ITEMS]
+
+def mock_response_key(filename):
+    """Pick the mock data for filename: (vendor/items index, receipt date)"""
+    # Use a stable hash of the filename to create some variation
+    idx = zlib.crc32(filename.encode('utf-8')) % len(_MOCK_VENDORS)
+    return idx, datetime.now().strftime("%Y-%m-%d")
+
+@lru_cache(maxsize=64)
+def create_mock_textract_response(idx, receipt_date):
+    """
+    Create mock textract response with varied data for demo
+
+    Upload names are unique, so the cache is keyed on the content
+    (see mock_response_key). The result is shared between callers, line
+    items included; treat it as read-only.
+    """
+    selected_vendor = _MOCK_VENDORS[idx]
+    total = _MOCK_TOTALS[idx]
+    line_items = _LINE_ITEM_TEMPLATES[idx]
 
     return {
         "DocumentMetadata": {"Pages": 1},
@@ -102,7 +144,7 @@ def create_mock_textract_response(filename):
                 {
                     "Type": {"Text": "INVOICE_RECEIPT_DATE", "Confidence": 95.12},
                     "ValueDetection": {
-                        "Text": datetime.now().strftime("%Y-%m-%d"),
+                        "Text": receipt_date,
                         "Confidence": 95.12,
                         "Geometry": {
                             "BoundingBox": {"Width": 0.2, "Height": 0.04, "Left": 0.4, "Top": 0.15},
@@ -116,52 +158,138 @@ def create_mock_textract_response(filename):
         }]
     }
 
-def process_receipt_file(file_path, filename):
-    """Process a single receipt file"""
+@lru_cache(maxsize=64)
+def pretty_print_response(idx, receipt_date):
+    """Pretty print the mock response for (idx, receipt_date), as UTF-8 bytes"""
+    return get_string(
+        textract_json=create_mock_textract_response(idx, receipt_date),
+        output_type=[
+            Textract_Expense_Pretty_Print.SUMMARY,
+            Textract_Expense_Pretty_Print.LINEITEMGROUPS
+        ],
+        table_format=Pretty_Print_Table_Format.fancy_grid
+    ).encode('utf-8')
+
+def process_receipt_file(file_path, filename, writer, return_full=False):
+    """
+    Process a single receipt file, queueing its outputs on writer
+
+    Returns (result, ledger_entry). The result carries a short summary of the
+    receipt; the full response is included only with return_full (it is
+    otherwise served by /raw/<filename>). ledger_entry holds the
+    record_receipt arguments, to be recorded once the outputs are written.
+    """
     try:
         # Create mock response (in real implementation, would call Textract)
-        mock_response = create_mock_textract_response(filename)
+        response_key = mock_response_key(filename)
+        mock_response = create_mock_textract_response(*response_key)
 
         # Pretty print the response
-        pretty_printed_string = get_string(
-            textract_json=mock_response,
-            output_type=[
-                Textract_Expense_Pretty_Print.SUMMARY,
-                Textract_Expense_Pretty_Print.LINEITEMGROUPS
-            ],
-            table_format=Pretty_Print_Table_Format.fancy_grid
-        )
+        pretty_printed_bytes = pretty_print_response(*response_key)
 
         # Save outputs
         base_name = os.path.splitext(filename)[0]
 
+        processed_at = datetime.now().isoformat()
+
         # Save pretty printed text
         txt_file = os.path.join(OUTPUT_FOLDER, f"{base_name}-response.txt")
-        with open(txt_file, 'w', encoding='utf-8') as f:
-            f.write(f"Receipt processed at: {datetime.now().isoformat()}\n")
-            f.write(f"Input file: {filename}\n")
-            f.write("=" * 50 + "\n\n")
-            f.write(pretty_printed_string)
+        header = f"Receipt processed at: {processed_at}\nInput file: {filename}\n".encode('utf-8')
+        writer.submit(txt_file, b''.join((header, _SEP_BYTES, pretty_printed_bytes)))
 
         # Save raw JSON
         json_file = os.path.join(OUTPUT_FOLDER, f"{base_name}-raw.json")
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(mock_response, f, indent=2)
+        writer.submit(json_file, orjson.dumps(mock_response, option=orjson.OPT_INDENT_2))
 
-        return {
+        fields = extract_receipt_fields(mock_response)
+
+        result = {
             'success': True,
             'filename': filename,
             'txt_file': txt_file,
             'json_file': json_file,
-            'mock_response': mock_response
+            'summary': {
+                'vendor': fields['vendor_name'],
+                'total': fields['total'],
+                'date': fields['date']
+            }
         }
+        if return_full:
+            result['mock_response'] = mock_response
+        return result, (base_name, fields, processed_at)
 
     except Exception as e:
         return {
             'success': False,
             'filename': filename,
             'error': str(e)
-        }
+        }, None
+
+def record_receipt(base_name, fields, processed_at):
+    """Add (or replace) the CSV rows for a processed receipt"""
+    vendor_name = fields['vendor_name']
+    total = fields['total']
+    date = fields['date']
+    items = fields['items']
+
+    summary_row = [base_name, vendor_name, total, date, len(items), processed_at]
+    if items:
+        detail_rows = [[base_name, vendor_name, total, date, item['item'], item['price'], processed_at]
+                       for item in items]
+    else:
+        detail_rows = [[base_name, vendor_name, total, date, '', '', processed_at]]
+
+    with _RECEIPT_ROWS_LOCK:
+        _RECEIPT_ROWS[base_name] = (summary_row, detail_rows)
+
+def extract_cached(json_path):
+    """Extract receipt fields from a raw JSON file, reusing results for unchanged files"""
+    st = os.stat(json_path)
+    key = (st.st_mtime_ns, st.st_size)
+
+    cached = _JSON_EXTRACT_CACHE.get(json_path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    with open(json_path, 'rb') as f:
+        fields = extract_receipt_fields(orjson.loads(f.read()))
+
+    _JSON_EXTRACT_CACHE[json_path] = (key, fields)
+    return fields
+
+def sync_receipt_rows():
+    """
+    Bring the CSV rows in line with the raw JSON outputs on disk
+
+    Picks up outputs written by previous runs or by other server worker
+    processes, and drops rows whose outputs were removed. Only receipts not
+    already known are read and parsed.
+    """
+    with os.scandir(OUTPUT_FOLDER) as it:
+        base_names = {entry.name[:-len('-raw.json')] for entry in it
+                      if entry.name.endswith('-raw.json') and entry.is_file()}
+
+    with _RECEIPT_ROWS_LOCK:
+        for base_name in _RECEIPT_ROWS.keys() - base_names:
+            del _RECEIPT_ROWS[base_name]
+        missing = base_names - _RECEIPT_ROWS.keys()
+
+    for base_name in missing:
+        json_path = os.path.join(OUTPUT_FOLDER, f"{base_name}-raw.json")
+        try:
+            fields = extract_cached(json_path)
+            processed_at = datetime.fromtimestamp(os.path.getmtime(json_path)).isoformat()
+        except Exception as e:
+            print(f"Error loading {json_path}: {e}")
+            continue
+
+        record_receipt(base_name, fields, processed_at)
+
+sync_receipt_rows()
+
+def zip_csv_writer(zf, name):
+    """Open a new ZIP entry as a text stream suitable for csv.writer"""
+    return io.TextIOWrapper(zf.open(name, 'w', force_zip64=True), encoding='utf-8', newline='')
 
 @app.route('/')
 def index():
@@ -173,24 +301,54 @@ def upload_files():
         return jsonify({'error': 'No files provided'}), 400
 
     files = request.files.getlist('files')
-    results = []
+    return_full = request.args.get('full', type=int, default=0) == 1
+    writer = UringBatchWriter()
+
+    # Add timestamp and per-request counter to avoid conflicts
+    prefix = datetime.now().strftime("%Y%m%d_%H%M%S")
+    counter = itertools.count()
 
+    # Save uploads serially (FileStorage streams are not thread-safe)
+    pairs = []
     for file in files:
         if file.filename == '':
             continue
 
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            # Add timestamp to avoid conflicts
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{timestamp}_{filename}"
+            filename = f"{prefix}_{next(counter)}_{fast_safe_name(file.filename)}"
 
             file_path = os.path.join(UPLOAD_FOLDER, filename)
             file.save(file_path)
+            pairs.append((file_path, filename))
 
-            # Process the file
-            result = process_receipt_file(file_path, filename)
-            results.append(result)
+    # Process the files concurrently
+    outcomes = []
+    if pairs:
+        with ThreadPoolExecutor(max_workers=min(8, len(pairs))) as ex:
+            outcomes = list(ex.map(lambda p: process_receipt_file(*p, writer, return_full), pairs))
+
+    # Write all queued outputs in one batch
+    try:
+        writer.close()
+    except Exception as e:
+        return jsonify({'error': f'Failed to save outputs: {e}'}), 500
+
+    # Only receipts whose outputs were both written go into the CSV ledger
+    results = []
+    for result, ledger_entry in outcomes:
+        if result['success']:
+            errors = [writer.failed[path] for path in (result['txt_file'], result['json_file'])
+                      if path in writer.failed]
+            if errors:
+                result = {
+                    'success': False,
+                    'filename': result['filename'],
+                    'error': f'Failed to save outputs: {errors[0]}'
+                }
+            else:
+                # Keep the CSV rows so /download-csv doesn't have to re-read the outputs
+                record_receipt(*ledger_entry)
+        results.append(result)
 
     return jsonify({
         'success': True,
@@ -198,96 +356,51 @@ def upload_files():
         'total_processed': len([r for r in results if r['success']])
     })
 
+@app.route('/raw/<filename>')
+def raw_response(filename):
+    """Serve the raw JSON response saved for a processed file"""
+    base_name = os.path.splitext(filename)[0]
+    return send_from_directory(os.path.abspath(OUTPUT_FOLDER), f"{base_name}-raw.json", mimetype='application/json')
+
 @app.route('/download-csv')
 def download_csv():
     try:
-        # Generate CSV from all processed files
-        json_files = [f for f in os.listdir(OUTPUT_FOLDER) if f.endswith('-raw.json')]
+        sync_receipt_rows()
+        with _RECEIPT_ROWS_LOCK:
+            receipt_rows = list(_RECEIPT_ROWS.values())
 
-        if not json_files:
+        if not receipt_rows:
             return jsonify({'error': 'No processed files found'}), 404
 
-        # Create a ZIP file containing both CSV formats
-        memory_file = io.BytesIO()
-
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            # Summary CSV
-            summary_csv = io.StringIO()
-            summary_writer = csv.writer(summary_csv)
-            summary_writer.writerow(['filename', 'vendor_name', 'total', 'date', 'item_count', 'processed_at'])
-
-            # Detailed CSV
-            detailed_csv = io.StringIO()
-            detailed_writer = csv.writer(detailed_csv)
-            detailed_writer.writerow(['filename', 'vendor_name', 'receipt_total', 'receipt_date',
-                                    'item_name', 'item_price', 'processed_at'])
-
-            for json_file in json_files:
-                json_path = os.path.join(OUTPUT_FOLDER, json_file)
-                with open(json_path, 'r') as f:
-                    data = json.load(f)
-
-                # Extract data
-                filename = json_file.replace('-raw.json', '')
-                vendor_name = ''
-                total = ''
-                date = ''
-                items = []
-                processed_at = datetime.now().isoformat()
-
-                for expense_doc in data.get('ExpenseDocuments', []):
-                    for field in expense_doc.get('SummaryFields', []):
-                        field_type = field.get('Type', {}).get('Text', '')
-                        field_value = field.get('ValueDetection', {}).get('Text', '')
-
-                        if field_type == 'VENDOR_NAME':
-                            vendor_name = field_value
-                        elif field_type == 'TOTAL':
-                            total = field_value
-                        elif field_type == 'INVOICE_RECEIPT_DATE':
-                            date = field_value
-
-                    # Extract line items
-                    for line_group in expense_doc.get('LineItemGroups', []):
-                        for line_item in line_group.get('LineItems', []):
-                            item_name = ''
-                            item_price = ''
-
-                            for field in line_item.get('LineItemExpenseFields', []):
-                                field_type = field.get('Type', {}).get('Text', '')
-                                field_value = field.get('ValueDetection', {}).get('Text', '')
-
-                                if field_type == 'ITEM':
-                                    item_name = field_value
-                                elif field_type == 'PRICE':
-                                    item_price = field_value
-
-                            if item_name or item_price:
-                                items.append({'item': item_name, 'price': item_price})
-
-                # Write to summary CSV
-                summary_writer.writerow([filename, vendor_name, total, date, len(items), processed_at])
-
-                # Write to detailed CSV
-                if items:
-                    for item in items:
-                        detailed_writer.writerow([filename, vendor_name, total, date,
-                                                item['item'], item['price'], processed_at])
-                else:
-                    detailed_writer.writerow([filename, vendor_name, total, date, '', '', processed_at])
-
-            # Add CSVs to ZIP
-            zf.writestr('receipt_summary.csv', summary_csv.getvalue())
-            zf.writestr('receipt_details.csv', detailed_csv.getvalue())
-
-        memory_file.seek(0)
-
-        return send_file(
-            memory_file,
+        # Create a ZIP file containing both CSV formats, spilling to disk once it gets large
+        zip_file = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE)
+
+        with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+            # Rows are encoded and compressed straight into each ZIP entry
+            with zip_csv_writer(zf, 'receipt_summary.csv') as summary_csv:
+                summary_writer = csv.writer(summary_csv)
+                summary_writer.writerow(['filename', 'vendor_name', 'total', 'date', 'item_count', 'processed_at'])
+                summary_writer.writerows(summary_row for summary_row, _ in receipt_rows)
+
+            with zip_csv_writer(zf, 'receipt_details.csv') as detailed_csv:
+                detailed_writer = csv.writer(detailed_csv)
+                detailed_writer.writerow(['filename', 'vendor_name', 'receipt_total', 'receipt_date',
+                                        'item_name', 'item_price', 'processed_at'])
+                detailed_writer.writerows(detail_row for _, detail_rows in receipt_rows
+                                          for detail_row in detail_rows)
+
+        # werkzeug can only size BytesIO bodies, so set Content-Length ourselves
+        size = zip_file.tell()
+        zip_file.seek(0)
+
+        response = send_file(
+            zip_file,
             mimetype='application/zip',
             as_attachment=True,
             download_name=f'receipt_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
         )
+        response.content_length = size
+        return response
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -297,14 +410,17 @@ def clear_files():
     try:
         # Clear upload and output folders
         for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER]:
-            for filename in os.listdir(folder):
-                file_path = os.path.join(folder, filename)
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_file():
+                        os.unlink(entry.path)
+        _JSON_EXTRACT_CACHE.clear()
+        with _RECEIPT_ROWS_LOCK:
+            _RECEIPT_ROWS.clear()
 
         return jsonify({'success': True, 'message': 'All files cleared'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
@@ -5,64 +5,28 @@ Converts processed receipt data to CSV format
 """
 
 import csv
-import json
 import os
 import glob
 from datetime import datetime
+import orjson
+from extract import extract_receipt_fields
 
-def extract_data_from_json(json_file_path):
+def extract_data_from_json(json_file_path, processed_at=None):
     """
     Extract relevant data from Textract JSON response
+
+    processed_at defaults to the current time; pass one shared timestamp
+    when extracting a batch of files for the same export.
     """
-    with open(json_file_path, 'r') as f:
-        data = json.load(f)
+    with open(json_file_path, 'rb') as f:
+        data = orjson.loads(f.read())
 
-    # Initialize extracted data
-    extracted = {
+    return {
         'filename': os.path.basename(json_file_path).replace('-raw-response.json', ''),
-        'vendor_name': '',
-        'total': '',
-        'date': '',
-        'items': [],
-        'processed_at': datetime.now().isoformat()
+        'processed_at': processed_at or datetime.now().isoformat(),
+        **extract_receipt_fields(data)
     }
 
-    # Extract summary fields
-    for expense_doc in data.get('ExpenseDocuments', []):
-        for field in expense_doc.get('SummaryFields', []):
-            field_type = field.get('Type', {}).get('Text', '')
-            field_value = field.get('ValueDetection', {}).get('Text', '')
-
-            if field_type == 'VENDOR_NAME':
-                extracted['vendor_name'] = field_value
-            elif field_type == 'TOTAL':
-                extracted['total'] = field_value
-            elif field_type == 'INVOICE_RECEIPT_DATE':
-                extracted['date'] = field_value
-
-        # Extract line items
-        for line_group in expense_doc.get('LineItemGroups', []):
-            for line_item in line_group.get('LineItems', []):
-                item_name = ''
-                item_price = ''
-
-                for field in line_item.get('LineItemExpenseFields', []):
-                    field_type = field.get('Type', {}).get('Text', '')
-                    field_value = field.get('ValueDetection', {}).get('Text', '')
-
-                    if field_type == 'ITEM':
-                        item_name = field_value
-                    elif field_type == 'PRICE':
-                        item_price = field_value
-
-                if item_name or item_price:
-                    extracted['items'].append({
-                        'item': item_name,
-                        'price': item_price
-                    })
-
-    return extracted
-
 def generate_summary_csv(output_dir="output"):
     """
     Generate a summary CSV with one row per receipt
@@ -80,9 +44,10 @@ def generate_summary_csv(output_dir="output"):
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
 
+        now_iso = datetime.now().isoformat()
         for json_file in json_files:
             try:
-                data = extract_data_from_json(json_file)
+                data = extract_data_from_json(json_file, now_iso)
                 writer.writerow({
                     'filename': data['filename'],
                     'vendor_name': data['vendor_name'],
@@ -112,36 +77,19 @@ def generate_detailed_csv(output_dir="output"):
     with open(csv_file_path, 'w', newline='', encoding='utf-8') as csvfile:
         fieldnames = ['filename', 'vendor_name', 'receipt_total', 'receipt_date',
                      'item_name', 'item_price', 'processed_at']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
+        writer = csv.writer(csvfile)
+        writer.writerow(fieldnames)
 
+        now_iso = datetime.now().isoformat()
         for json_file in json_files:
             try:
-                data = extract_data_from_json(json_file)
-
-                # If there are line items, write one row per item
-                if data['items']:
-                    for item in data['items']:
-                        writer.writerow({
-                            'filename': data['filename'],
-                            'vendor_name': data['vendor_name'],
-                            'receipt_total': data['total'],
-                            'receipt_date': data['date'],
-                            'item_name': item['item'],
-                            'item_price': item['price'],
-                            'processed_at': data['processed_at']
-                        })
-                else:
-                    # If no line items, write summary info only
-                    writer.writerow({
-                        'filename': data['filename'],
-                        'vendor_name': data['vendor_name'],
-                        'receipt_total': data['total'],
-                        'receipt_date': data['date'],
-                        'item_name': '',
-                        'item_price': '',
-                        'processed_at': data['processed_at']
-                    })
+                data = extract_data_from_json(json_file, now_iso)
+                receipt = (data['filename'], data['vendor_name'], data['total'], data['date'])
+                processed_at = data['processed_at']
+
+                # One row per line item, or summary info only if there are none
+                items = data['items'] or [{'item': '', 'price': ''}]
+                writer.writerows([(*receipt, item['item'], item['price'], processed_at) for item in items])
             except Exception as e:
                 print(f"Error processing {json_file}: {e}")
 
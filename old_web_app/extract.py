@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Receipt Field Extraction
+Pulls vendor, total, date and line items out of Textract AnalyzeExpense responses
+"""
+
+# Textract field types -> keys of the extracted receipt data
+_SUMMARY_FIELD_DISPATCH = {'VENDOR_NAME': 'vendor_name', 'TOTAL': 'total', 'INVOICE_RECEIPT_DATE': 'date'}
+_LINE_ITEM_FIELD_DISPATCH = {'ITEM': 'item', 'PRICE': 'price'}
+
+def extract_receipt_fields(data):
+    """
+    Extract receipt fields from a parsed Textract expense response
+
+    Returns a dict with vendor_name, total, date (empty strings when absent)
+    and items, a list of {'item', 'price'} dicts.
+    """
+    extracted = {'vendor_name': '', 'total': '', 'date': '', 'items': []}
+    items = extracted['items']
+
+    # Extract summary fields
+    for expense_doc in data.get('ExpenseDocuments', ()):
+        for field in expense_doc.get('SummaryFields', ()):
+            try:
+                key = _SUMMARY_FIELD_DISPATCH.get(field['Type']['Text'])
+                if key:
+                    extracted[key] = field['ValueDetection']['Text']
+            except KeyError:
+                continue
+
+        # Extract line items
+        for line_group in expense_doc.get('LineItemGroups', ()):
+            for line_item in line_group.get('LineItems', ()):
+                item = {'item': '', 'price': ''}
+
+                for field in line_item.get('LineItemExpenseFields', ()):
+                    try:
+                        key = _LINE_ITEM_FIELD_DISPATCH.get(field['Type']['Text'])
+                        if key:
+                            item[key] = field['ValueDetection']['Text']
+                    except KeyError:
+                        continue
+
+                if item['item'] or item['price']:
+                    items.append(item)
+
+    return extracted
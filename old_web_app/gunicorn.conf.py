@@ -0,0 +1,15 @@
+"""
+Gunicorn configuration for the receipt processor web interface
+
+Run from this directory with:
+    gunicorn app:app
+"""
+
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Threaded workers: uploads spend most of their time in file I/O
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Batched File Writer for Receipt Outputs
+Queues output files and flushes them with a single io_uring submission
+
+Uses the liburing 2024.x package API (pip install "liburing>=2024.4,<2025");
+other releases fall back to plain blocking writes with a warning.
+"""
+
+import os
+import threading
+import warnings
+
+try:
+    import liburing
+except ImportError:
+    # liburing is Linux-only; fall back to plain blocking writes
+    liburing = None
+
+# liburing 2024.x functions used below (2026.x replaced this API entirely)
+_LIBURING_API = (
+    'io_uring', 'io_uring_cqe', 'io_uring_queue_init', 'io_uring_queue_exit',
+    'io_uring_get_sqe', 'io_uring_prep_write', 'io_uring_sqe_set_data64', 'io_uring_submit',
+    'io_uring_wait_cqe', 'io_uring_cqe_get_data64', 'io_uring_cqe_seen',
+)
+
+if liburing is not None and not all(hasattr(liburing, name) for name in _LIBURING_API):
+    warnings.warn(
+        f"liburing {getattr(liburing, '__version__', '?')} lacks the 2024.x API; "
+        "writing outputs without io_uring",
+        RuntimeWarning
+    )
+    liburing = None
+
+# O_BINARY (Windows only) stops the CRT from translating \n in written bytes
+OPEN_FLAGS = os.O_CREAT | os.O_WRONLY | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+
+
+def _write_fd(fd, buf):
+    view = memoryview(buf)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def write_file(path, buf):
+    """Write buf to path with raw os-level calls (no buffered file object)"""
+    fd = os.open(path, OPEN_FLAGS, 0o644)
+    try:
+        _write_fd(fd, buf)
+    finally:
+        os.close(fd)
+
+
+class UringBatchWriter:
+    """
+    Collect (path, bytes) pairs and write them in one batch
+
+    With liburing available, every queued write becomes one SQE and the
+    whole batch is submitted with a single io_uring_enter call, then the
+    completions are reaped. Without it, submit() writes synchronously.
+
+    Write errors are not raised: each failed path is recorded in failed
+    (path -> exception), and a file it truncated is removed, so once close()
+    returns the caller can tell exactly which outputs were written.
+    Safe to share between worker threads.
+    """
+
+    def __init__(self, entries=64):
+        self.entries = entries
+        self.pending = []
+        self.failed = {}
+        self.ring = None
+        self.lock = threading.Lock()
+
+        if liburing is not None:
+            try:
+                self.ring = liburing.io_uring()
+                liburing.io_uring_queue_init(entries, self.ring, 0)
+            except OSError:
+                # Kernel without io_uring support (or it is disabled)
+                self.ring = None
+
+    def _fail(self, path, error):
+        """Record a failed write and remove whatever it left behind"""
+        self.failed[path] = error
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def submit(self, path, buf):
+        """Queue buf to be written to path"""
+        try:
+            fd = os.open(path, OPEN_FLAGS, 0o644)
+        except OSError as e:
+            # Nothing was opened (or truncated), so there is nothing to remove
+            self.failed[path] = e
+            return
+
+        if self.ring is None:
+            error = None
+            try:
+                _write_fd(fd, buf)
+            except OSError as e:
+                error = e
+            finally:
+                os.close(fd)
+            if error is not None:
+                self._fail(path, error)
+            return
+
+        with self.lock:
+            self.pending.append((path, fd, buf))
+            if len(self.pending) >= self.entries:
+                self._flush_locked()
+
+    def flush(self):
+        """Submit all queued writes and wait for their completions"""
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, []
+        completed = set()
+
+        try:
+            for index, (_, fd, buf) in enumerate(pending):
+                sqe = liburing.io_uring_get_sqe(self.ring)
+                liburing.io_uring_prep_write(sqe, fd, buf, len(buf), 0)
+                # user_data 0 is rejected, so completions carry index + 1
+                liburing.io_uring_sqe_set_data64(sqe, index + 1)
+
+            liburing.io_uring_submit(self.ring)
+
+            cqe = liburing.io_uring_cqe()
+            for _ in range(len(pending)):
+                liburing.io_uring_wait_cqe(self.ring, cqe)
+                index = liburing.io_uring_cqe_get_data64(cqe) - 1
+                path, _, buf = pending[index]
+                completed.add(index)
+                if cqe.res < 0:
+                    self._fail(path, OSError(-cqe.res, os.strerror(-cqe.res), path))
+                elif cqe.res != len(buf):
+                    self._fail(path, OSError(f"Short write to {path}: {cqe.res} of {len(buf)} bytes"))
+                liburing.io_uring_cqe_seen(self.ring, cqe)
+        except Exception as e:
+            # The ring itself failed: every write not yet completed is lost, and
+            # later ones go through plain blocking writes
+            for index, (path, _, _) in enumerate(pending):
+                if index not in completed:
+                    self._fail(path, e)
+            self._release_ring()
+        finally:
+            for _, fd, _ in pending:
+                os.close(fd)
+
+    def _release_ring(self):
+        if self.ring is not None:
+            ring, self.ring = self.ring, None
+            try:
+                liburing.io_uring_queue_exit(ring)
+            except Exception:
+                pass
+
+    def close(self):
+        """Flush remaining writes and release the ring"""
+        try:
+            self.flush()
+        finally:
+            self._release_ring()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -5,19 +5,61 @@ Manages CSV file creation and safe appending of receipt data
 """
 
 import csv
+import io
 import os
+from itertools import islice
 from datetime import datetime
-from typing import List, Dict
-import fcntl
+from typing import Dict, Iterable, List
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock; single-writer appends don't need it
+    fcntl = None
 
-def write_csv(rows: List[Dict], out_path: str) -> None:
+# Rows encoded and written per write() call (receipt rows are ~100 bytes each)
+CSV_FLUSH_ROWS = 1000
+
+
+def _locked() -> bool:
+    """
+    Whether appends should take an exclusive file lock
+
+    Set TABEQ_MULTIWRITER=1 when several processes append to the same CSV, so
+    they agree on who writes the headers. Read per call, so a value loaded
+    from .env after import still applies.
+    """
+    return fcntl is not None and os.environ.get('TABEQ_MULTIWRITER', '0') == '1'
+
+
+def _append(fd: int, header: bytes, payload: bytes) -> None:
+    """Append payload to fd in one write, prefixed by header if the file is still empty"""
+    # Get exclusive lock so concurrent writers agree on who writes the headers
+    locked = _locked()
+    if locked:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        # Headers only go into a new (empty) file
+        if header and os.fstat(fd).st_size == 0:
+            payload = header + payload
+
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+
+    finally:
+        # Release lock
+        if locked:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def write_csv(rows: Iterable[Dict], out_path: str) -> None:
     """
     Write receipt data rows to CSV file, creating headers if needed
 
     Args:
-        rows: List of dictionaries containing receipt data
+        rows: Iterable (list or generator) of dictionaries containing receipt data
         out_path: Output CSV file path
 
     Headers:
@@ -26,49 +68,56 @@ def write_csv(rows: List[Dict], out_path: str) -> None:
     The function:
         - Creates output directory if it doesn't exist
         - Creates CSV file with headers if it doesn't exist
-        - Appends rows safely with file locking
+        - Appends rows safely (with file locking when TABEQ_MULTIWRITER=1)
         - Adds processed_at timestamp automatically
+
+    The file is opened once per call. Rows are consumed lazily and written
+    CSV_FLUSH_ROWS at a time, each chunk with a single write().
     """
     # Define CSV headers
     headers = ['date', 'start_time', 'end_time', 'total', 'source_file', 'processed_at']
 
     # Create output directory if it doesn't exist
-    out_dir = os.path.dirname(out_path)
-    if out_dir and not os.path.exists(out_dir):
-        os.makedirs(out_dir, exist_ok=True)
-
-    # Check if file exists to determine if we need to write headers
-    file_exists = os.path.exists(out_path)
-
-    # Add processed_at timestamp to each row if not present
-    for row in rows:
-        if 'processed_at' not in row or not row['processed_at']:
-            row['processed_at'] = datetime.now().isoformat()
-
-    # Open file in append mode with UTF-8 encoding
-    with open(out_path, 'a', newline='', encoding='utf-8') as csvfile:
-        try:
-            # Get exclusive lock for thread-safe writing
-            fcntl.flock(csvfile.fileno(), fcntl.LOCK_EX)
-
-            writer = csv.DictWriter(csvfile, fieldnames=headers)
-
-            # Write headers if this is a new file
-            if not file_exists:
-                writer.writeheader()
-
-            # Write data rows
-            for row in rows:
-                # Ensure all required fields are present (use None for missing)
-                clean_row = {}
-                for header in headers:
-                    clean_row[header] = row.get(header, None)
-
-                writer.writerow(clean_row)
-
-        finally:
-            # Release lock
-            fcntl.flock(csvfile.fileno(), fcntl.LOCK_UN)
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    header = buffer.getvalue().encode('utf-8')
+
+    # Rows become tuples in header order (missing fields become None), with
+    # one shared processed_at timestamp where not present
+    now_iso = datetime.now().isoformat()
+    data_headers = headers[:-1]
+    all_rows = (
+        (*map(row.get, data_headers), row.get('processed_at') or now_iso)
+        for row in rows
+    )
+
+    # O_APPEND makes the kernel place each write at the current end of file
+    # (O_BINARY keeps Windows from turning csv's \r\n into \r\r\n)
+    fd = os.open(out_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        while True:
+            chunk = list(islice(all_rows, CSV_FLUSH_ROWS))
+            if not chunk:
+                break
+
+            # Encode the chunk in memory so the file sees a single write for it.
+            # (A memory-mapped append would need the file preallocated past its data,
+            # leaving NUL padding that CSV readers can't handle, and for chunks this
+            # small the mapping/page-fault cost outweighs the one write() it replaces)
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(chunk)
+            _append(fd, header, buffer.getvalue().encode('utf-8'))
+            header = b''
+
+        # No rows at all: a new file still gets its headers
+        if header:
+            _append(fd, header, b'')
+    finally:
+        os.close(fd)
 
 
 def read_csv(csv_path: str) -> List[Dict]:
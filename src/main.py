@@ -7,7 +7,10 @@ Coordinates Textract extraction and CSV writing
 import os
 import sys
 import argparse
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List
 from dotenv import load_dotenv
 
 # Import our modules
@@ -48,91 +51,179 @@ def validate_environment():
     return True
 
 
-def process_receipt(input_path: str, output_path: str, verbose: bool = False) -> bool:
+def extract_receipt_row(input_path: str, verbose: bool = False) -> Dict:
     """
-    Process a single receipt file
+    Extract and parse a single receipt into a CSV row
 
     Args:
         input_path: Path to receipt image
+        verbose: Enable verbose logging
+
+    Returns:
+        dict: CSV row for the receipt
+
+    Raises:
+        FileNotFoundError: If the receipt file doesn't exist
+        Exception: For Textract client/API errors
+    """
+    print(f"Processing {os.path.basename(input_path)} with AWS Textract...")
+
+    # Extract text from image
+    if verbose:
+        print(f"  Extracting text from: {input_path}")
+
+    text_content = extract_blocks(input_path)
+
+    if verbose:
+        print(f"  Extracted {len(text_content)} characters of text")
+        print("\n--- Extracted Text Preview ---")
+        preview = text_content[:500] + "..." if len(text_content) > 500 else text_content
+        print(preview)
+        print("--- End Preview ---\n")
+
+    # Parse fields from extracted text
+    if verbose:
+        print("  Parsing fields from text...")
+
+    fields = parse_fields(text_content)
+
+    if verbose:
+        print("  Parsed fields:")
+        for key, value in fields.items():
+            print(f"    {key}: {value}")
+
+    # Prepare row for CSV
+    return {
+        'date': fields.get('date'),
+        'start_time': fields.get('start_time'),
+        'end_time': fields.get('end_time'),
+        'total': fields.get('total'),
+        'source_file': os.path.basename(input_path),
+        'processed_at': None  # Will be auto-filled by csv_writer
+    }
+
+
+def report_error(e: Exception, output_path: str, verbose: bool = False) -> None:
+    """
+    Print a user-facing message for a processing error
+
+    Must be called from the except block handling e.
+    """
+    if isinstance(e, FileNotFoundError):
+        print(f"Error: {e}")
+        return
+
+    if "Failed to create Textract client" in str(e):
+        print(f"Error: AWS credentials not configured. Please check your .env file")
+        print(f"Details: {e}")
+    elif "Textract API error" in str(e):
+        print(f"Error: Failed to process image with Textract: {e}")
+    elif "Permission" in str(e):
+        print(f"Error: Cannot write to output file: {output_path}")
+        print(f"Details: {e}")
+    else:
+        print(f"Error: An unexpected error occurred: {e}")
+
+    if verbose:
+        import traceback
+        print("\n--- Full Error Trace ---")
+        traceback.print_exc()
+
+
+def process_receipts(input_paths: List[str], output_path: str, verbose: bool = False,
+                     workers: int = 4) -> bool:
+    """
+    Process receipt files concurrently and write their rows to one CSV
+
+    Textract calls for different receipts run on a thread pool, so one
+    receipt's HTTPS round-trip overlaps with the others' requests and
+    parsing. Rows are streamed to a single write_csv call in input order as
+    their receipts finish.
+
+    Args:
+        input_paths: Paths to receipt images
         output_path: Path to output CSV
         verbose: Enable verbose logging
+        workers: Maximum number of concurrent Textract requests
 
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if every receipt was processed and written, False otherwise
     """
-    try:
-        # Validate input file exists
-        if not os.path.exists(input_path):
+    success = True
+
+    # Validate input files exist
+    existing_paths = []
+    for input_path in input_paths:
+        if os.path.exists(input_path):
+            existing_paths.append(input_path)
+        else:
             print(f"Error: Receipt file not found: {input_path}")
-            return False
+            success = False
 
-        print("Processing with AWS Textract...")
+    if not existing_paths:
+        return False
 
-        # Extract text from image
-        if verbose:
-            print(f"  Extracting text from: {input_path}")
+    failed = []
 
-        text_content = extract_blocks(input_path)
+    def completed_rows(futures):
+        for future in futures:
+            try:
+                yield future.result()
+            except Exception as e:
+                report_error(e, output_path, verbose)
+                failed.append(future)
 
-        if verbose:
-            print(f"  Extracted {len(text_content)} characters of text")
-            print("\n--- Extracted Text Preview ---")
-            preview = text_content[:500] + "..." if len(text_content) > 500 else text_content
-            print(preview)
-            print("--- End Preview ---\n")
+    with ThreadPoolExecutor(max_workers=min(workers, len(existing_paths))) as executor:
+        futures = [executor.submit(extract_receipt_row, input_path, verbose)
+                   for input_path in existing_paths]
 
-        # Parse fields from extracted text
-        if verbose:
-            print("  Parsing fields from text...")
+        # Wait for the first row so nothing is written when every receipt fails
+        rows = completed_rows(futures)
+        first_row = next(rows, None)
+        if first_row is None:
+            return False
 
-        fields = parse_fields(text_content)
+        # Write to CSV
+        try:
+            if verbose:
+                print(f"  Writing rows to CSV: {output_path}")
 
-        if verbose:
-            print("  Parsed fields:")
-            for key, value in fields.items():
-                print(f"    {key}: {value}")
+            write_csv(chain([first_row], rows), output_path)
+        except Exception as e:
+            report_error(e, output_path, verbose)
+            return False
 
-        # Prepare row for CSV
-        csv_row = {
-            'date': fields.get('date'),
-            'start_time': fields.get('start_time'),
-            'end_time': fields.get('end_time'),
-            'total': fields.get('total'),
-            'source_file': os.path.basename(input_path),
-            'processed_at': None  # Will be auto-filled by csv_writer
-        }
+    if failed:
+        success = False
 
-        # Write to CSV
-        if verbose:
-            print(f"  Writing to CSV: {output_path}")
+    print(f"Done. CSV saved to: {output_path}")
+    return success
 
-        write_csv([csv_row], output_path)
 
-        print(f"Done. CSV saved to: {output_path}")
-        return True
+def process_receipt(input_path: str, output_path: str, verbose: bool = False) -> bool:
+    """
+    Process a single receipt file
 
-    except FileNotFoundError as e:
-        print(f"Error: {e}")
-        return False
+    Args:
+        input_path: Path to receipt image
+        output_path: Path to output CSV
+        verbose: Enable verbose logging
 
-    except Exception as e:
-        if "Failed to create Textract client" in str(e):
-            print(f"Error: AWS credentials not configured. Please check your .env file")
-            print(f"Details: {e}")
-        elif "Textract API error" in str(e):
-            print(f"Error: Failed to process image with Textract: {e}")
-        elif "Permission" in str(e):
-            print(f"Error: Cannot write to output file: {output_path}")
-            print(f"Details: {e}")
-        else:
-            print(f"Error: An unexpected error occurred: {e}")
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    return process_receipts([input_path], output_path, verbose)
 
-        if verbose:
-            import traceback
-            print("\n--- Full Error Trace ---")
-            traceback.print_exc()
 
-        return False
+def positive_int(value: str) -> int:
+    """argparse type for options that must be a whole number greater than zero"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
 
 def main():
@@ -146,14 +237,16 @@ Examples:
   python -m src.main --in receipts/receipt1.jpeg
   python -m src.main -i receipts/receipt1.jpeg -o output/receipts.csv
   python -m src.main --in receipts/receipt1.jpeg --verbose
+  python -m src.main --in receipts/*.jpeg --workers 8
         """
     )
 
     parser.add_argument(
         '--in', '-i',
         dest='input',
+        nargs='+',
         required=True,
-        help='Path to receipt image file (JPG, PNG, TIFF, PDF)'
+        help='Path(s) to receipt image files (JPG, PNG, TIFF, PDF)'
     )
 
     parser.add_argument(
@@ -163,6 +256,13 @@ Examples:
         help='Output CSV file path (default: output/receipt_data.csv)'
     )
 
+    parser.add_argument(
+        '--workers', '-w',
+        type=positive_int,
+        default=4,
+        help='Maximum concurrent Textract requests when processing several receipts (default: 4)'
+    )
+
     parser.add_argument(
         '--verbose', '-v',
         action='store_true',
@@ -178,11 +278,12 @@ Examples:
     if not validate_environment():
         sys.exit(1)
 
-    # Process receipt
-    success = process_receipt(
+    # Process receipts
+    success = process_receipts(
         args.input,
         args.output,
-        args.verbose
+        args.verbose,
+        args.workers
     )
 
     # Exit with appropriate code
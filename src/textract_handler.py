@@ -5,11 +5,154 @@ Handles image-to-text extraction and field parsing
 """
 
 import boto3
+import botocore.parsers
+import json
+import math
 import os
 import re
+import threading
+import uuid
+from boto3.s3.transfer import TransferConfig
+from functools import lru_cache
 from PIL import Image
 from io import BytesIO
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    # Optional speedup; botocore keeps using the stdlib json module without it
+    orjson = None
+
+# Image formats/modes Textract can take without conversion
+TEXTRACT_NATIVE_FORMATS = ('JPEG', 'PNG', 'TIFF')
+TEXTRACT_NATIVE_MODES = ('RGB', 'L')
+
+# Synchronous AnalyzeExpense takes single-page documents up to 5 MB inline;
+# larger native images are re-encoded rather than sent as they are
+TEXTRACT_MAX_PASSTHROUGH_BYTES = 5 * 1024 * 1024
+
+# JPEGs at least twice this size on their longest side are decoded at reduced scale
+TEXTRACT_MAX_DIMENSION = 2000
+
+# Single-pass baseline JPEG for converted images: no Huffman optimize pass or
+# progressive scans, which cost encode time and don't help OCR
+JPEG_SAVE_OPTIONS = {'quality': 90, 'optimize': False, 'progressive': False}
+
+# Images larger than this are staged in S3 (when TEXTRACT_S3_BUCKET is set)
+# instead of being sent inline as base64 Bytes
+S3_UPLOAD_THRESHOLD = 1_000_000
+
+# Staged uploads stream from a file object; only very large ones go multipart
+S3_TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024, use_threads=True)
+
+# Field patterns used by parse_fields, compiled once at import
+_DATE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{4})\b',  # MM-DD-YYYY or DD-MM-YYYY
+    r'\b(\d{4}[/-]\d{1,2}[/-]\d{1,2})\b',  # YYYY-MM-DD
+    r'\b(\d{1,2}\s+\w+\s+\d{4})\b',        # DD Month YYYY
+    r'\b(\w+\s+\d{1,2},?\s+\d{4})\b',      # Month DD, YYYY
+)]
+
+_TIME_RE = re.compile(r'(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm)?)')
+_TIME_RANGE_RE = re.compile(
+    r'(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm)?)\s*[-to]+\s*(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm)?)',
+    re.IGNORECASE
+)
+
+_TOTAL_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'AED\s*([\d,]+\.?\d*)',                    # AED 123.45
+    r'([\d,]+\.?\d*)\s*AED',                    # 123.45 AED
+    r'TOTAL[:\s]+AED\s*([\d,]+\.?\d*)',         # TOTAL: AED 123.45
+    r'TOTAL[:\s]+([\d,]+\.?\d*)',               # TOTAL: 123.45
+    r'AMOUNT[:\s]+AED\s*([\d,]+\.?\d*)',        # AMOUNT: AED 123.45
+    r'GRAND\s+TOTAL[:\s]+([\d,]+\.?\d*)',       # GRAND TOTAL: 123.45
+    r'(?:TOTAL|AMOUNT|SUM)[:\s]*\$?([\d,]+\.?\d*)', # Generic total patterns
+)]
+
+# Numbers that look like prices (fallback when no total pattern matches)
+_PRICE_RE = re.compile(r'\b(\d+\.?\d{0,2})\b')
+
+
+def _orjson_loads(s, *args, **kwargs):
+    """json.loads stand-in for botocore's response parsers, backed by orjson"""
+    if args or kwargs:
+        return json.loads(s, *args, **kwargs)
+    try:
+        return orjson.loads(s)
+    except orjson.JSONDecodeError:
+        # Re-parse with stdlib json so botocore sees its usual error
+        return json.loads(s)
+
+
+class _BotocoreJSON:
+    """Proxy for the json module as seen by botocore.parsers, with a faster loads"""
+    loads = staticmethod(_orjson_loads)
+
+    def __getattr__(self, name):
+        return getattr(json, name)
+
+
+# analyze_expense responses can be hundreds of KB of nested JSON. Swap the parser
+# only inside botocore.parsers, leaving the stdlib json module untouched
+if orjson is not None:
+    botocore.parsers.json = _BotocoreJSON()
+
+
+# boto3 sessions aren't thread-safe; serialize client creation (clients themselves are)
+_CLIENT_LOCK = threading.RLock()
+
+
+@lru_cache(maxsize=1)
+def _boto_session() -> boto3.session.Session:
+    """Shared boto3 session, so credentials/config files are only loaded once"""
+    return boto3.session.Session()
+
+
+@lru_cache(maxsize=4)
+def _textract_client(region: str):
+    """
+    Get the Textract client for a region, creating it on first use
+
+    Client creation loads the service model and builds the endpoint and
+    signer, so one client per region is reused for every receipt.
+    """
+    with _CLIENT_LOCK:
+        return _boto_session().client('textract', region_name=region)
+
+
+@lru_cache(maxsize=4)
+def _s3_client(region: str):
+    """Get the S3 client for a region, creating it on first use"""
+    with _CLIENT_LOCK:
+        return _boto_session().client('s3', region_name=region)
+
+
+def _analyze_expense_via_s3(textract, fileobj: BinaryIO, bucket: str, region: str, name: str) -> Dict:
+    """
+    Run analyze_expense on an image staged in S3
+
+    Textract reads the object directly from the bucket, so the request carries
+    no base64 payload. fileobj is streamed by upload_fileobj rather than
+    passed as one Body bytes object. The staged object is deleted afterwards.
+    """
+    prefix = os.environ.get('TEXTRACT_S3_PREFIX', 'textract-staging/')
+    key = f"{prefix}{uuid.uuid4().hex}-{name}"
+
+    s3 = _s3_client(region)
+    s3.upload_fileobj(fileobj, bucket, key, Config=S3_TRANSFER_CONFIG)
+    try:
+        return textract.analyze_expense(
+            Document={
+                'S3Object': {'Bucket': bucket, 'Name': key}
+            }
+        )
+    finally:
+        # A failed cleanup must not replace the analyze_expense result (or error)
+        try:
+            s3.delete_object(Bucket=bucket, Key=key)
+        except Exception as e:
+            print(f"Warning: Could not delete staged object s3://{bucket}/{key}: {e}")
 
 
 def extract_blocks(path: str) -> str:
@@ -26,44 +169,82 @@ def extract_blocks(path: str) -> str:
         FileNotFoundError: If image file doesn't exist
         Exception: For AWS Textract API errors
     """
-    if not os.path.exists(path):
+    # Check image file
+    try:
+        file_size = os.path.getsize(path)
+    except FileNotFoundError:
         raise FileNotFoundError(f"Image file not found: {path}")
 
-    # Read image file
-    with open(path, 'rb') as f:
-        image_bytes = f.read()
-
-    # Optionally preprocess image with Pillow if needed
+    # Optionally preprocess image with Pillow if needed. Image.open only reads the
+    # header, so images sent as-is are never decoded; image_bytes stays None for them
+    image_bytes = None
     try:
-        img = Image.open(BytesIO(image_bytes))
-        # Convert to RGB if needed (removes alpha channel, handles different formats)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        # Convert back to bytes
-        img_buffer = BytesIO()
-        img.save(img_buffer, format='JPEG')
-        image_bytes = img_buffer.getvalue()
+        with Image.open(path) as img:
+            width, height = img.size
+            longest = max(width, height)
+
+            # Very large JPEGs can be decoded at 1/2, 1/4 or 1/8 scale by libjpeg
+            # (DCT scaling), which is much cheaper and shrinks the upload
+            downscale = img.format == 'JPEG' and longest >= 2 * TEXTRACT_MAX_DIMENSION
+
+            # Textract accepts these as-is; skip the decode + lossy JPEG re-encode.
+            # Multi-page TIFFs are flattened to their first page, as before
+            passthrough = (img.format in TEXTRACT_NATIVE_FORMATS and img.mode in TEXTRACT_NATIVE_MODES
+                           and getattr(img, 'n_frames', 1) == 1
+                           and file_size <= TEXTRACT_MAX_PASSTHROUGH_BYTES)
+            if downscale or not passthrough:
+                if img.format == 'JPEG':
+                    # Let libjpeg convert colour space (and scale, keeping the longest
+                    # side at least TEXTRACT_MAX_DIMENSION) while decoding
+                    draft_size = img.size
+                    if downscale:
+                        scale = TEXTRACT_MAX_DIMENSION / longest
+                        draft_size = (math.ceil(width * scale), math.ceil(height * scale))
+                    img.draft(img.mode if img.mode in TEXTRACT_NATIVE_MODES else 'RGB', draft_size)
+
+                # Convert to RGB if needed (removes alpha channel, handles different formats)
+                if img.mode not in TEXTRACT_NATIVE_MODES:
+                    img = img.convert('RGB')
+
+                # Convert back to bytes
+                img_buffer = BytesIO()
+                img.save(img_buffer, format='JPEG', **JPEG_SAVE_OPTIONS)
+                image_bytes = img_buffer.getvalue()
     except Exception as e:
         print(f"Warning: Could not preprocess image: {e}")
         # Continue with original bytes
 
+    # Large images go through S3 if a bucket is configured
+    bucket = os.environ.get('TEXTRACT_S3_BUCKET')
+    payload_size = file_size if image_bytes is None else len(image_bytes)
+    via_s3 = bool(bucket) and payload_size > S3_UPLOAD_THRESHOLD
+
+    # Inline requests need the original bytes; S3 uploads stream the file instead
+    if image_bytes is None and not via_s3:
+        with open(path, 'rb') as f:
+            image_bytes = f.read()
+
     # Create Textract client
     # Check for region from environment (with fallback support)
     region = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
 
     try:
-        textract = boto3.client('textract', region_name=region)
+        textract = _textract_client(region)
     except Exception as e:
         raise Exception(f"Failed to create Textract client. Check AWS credentials: {e}")
 
     # Call Textract analyze_expense API
     try:
-        response = textract.analyze_expense(
-            Document={
-                'Bytes': image_bytes
-            }
-        )
+        if via_s3:
+            # Untouched files stream from disk; converted images only exist in memory
+            with (open(path, 'rb') if image_bytes is None else BytesIO(image_bytes)) as body:
+                response = _analyze_expense_via_s3(textract, body, bucket, region, os.path.basename(path))
+        else:
+            response = textract.analyze_expense(
+                Document={
+                    'Bytes': image_bytes
+                }
+            )
     except Exception as e:
         raise Exception(f"Textract API error: {e}")
 
@@ -89,10 +270,12 @@ def extract_blocks(path: str) -> str:
                             all_text_lines.append(text)
 
     # Also extract from Blocks if available for more complete text
+    seen = set(all_text_lines)
     for block in response.get('Blocks', []):
         if block.get('BlockType') == 'LINE':
             text = block.get('Text', '')
-            if text and text not in all_text_lines:
+            if text and text not in seen:
+                seen.add(text)
                 all_text_lines.append(text)
 
     # Return concatenated text
@@ -109,6 +292,10 @@ def parse_fields(lines: str) -> Dict[str, Optional[str]]:
     Returns:
         Dictionary with parsed fields: date, start_time, end_time, total
         Fields will be None if not found
+
+    Patterns run over the whole joined text on purpose: they may span line
+    breaks (e.g. "TOTAL:\n12.50") and earlier patterns win over earlier
+    positions, so stopping at the first line that matches would change results.
     """
     fields = {
         'date': None,
@@ -118,56 +305,35 @@ def parse_fields(lines: str) -> Dict[str, Optional[str]]:
     }
 
     # Parse date - multiple formats
-    date_patterns = [
-        r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{4})\b',  # MM-DD-YYYY or DD-MM-YYYY
-        r'\b(\d{4}[/-]\d{1,2}[/-]\d{1,2})\b',  # YYYY-MM-DD
-        r'\b(\d{1,2}\s+\w+\s+\d{4})\b',        # DD Month YYYY
-        r'\b(\w+\s+\d{1,2},?\s+\d{4})\b',      # Month DD, YYYY
-    ]
-
-    for pattern in date_patterns:
-        match = re.search(pattern, lines, re.IGNORECASE)
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(lines)
         if match:
             fields['date'] = match.group(1)
             break
 
-    # Parse time - look for time ranges or individual times
-    time_pattern = r'(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm)?)'
-    time_matches = re.findall(time_pattern, lines)
+    # Parse time - look for time ranges or individual times (only the first two are used)
+    time_matches = _TIME_RE.finditer(lines)
+    first_time = next(time_matches, None)
+    second_time = next(time_matches, None)
 
-    if len(time_matches) >= 2:
-        # Found at least two times, use first as start, second as end
-        fields['start_time'] = time_matches[0]
-        fields['end_time'] = time_matches[1]
-    elif len(time_matches) == 1:
-        # Only one time found, use it as start_time
-        fields['start_time'] = time_matches[0]
+    if first_time:
+        # Use first as start, and second (if found) as end
+        fields['start_time'] = first_time.group(1)
+        if second_time:
+            fields['end_time'] = second_time.group(1)
 
     # Also check for explicit time range pattern
-    time_range_pattern = r'(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm)?)\s*[-to]+\s*(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm)?)'
-    range_match = re.search(time_range_pattern, lines, re.IGNORECASE)
+    range_match = _TIME_RANGE_RE.search(lines)
     if range_match:
         fields['start_time'] = range_match.group(1)
         fields['end_time'] = range_match.group(2)
 
     # Parse total amount - focus on AED currency
-    total_patterns = [
-        r'AED\s*([\d,]+\.?\d*)',                    # AED 123.45
-        r'([\d,]+\.?\d*)\s*AED',                    # 123.45 AED
-        r'TOTAL[:\s]+AED\s*([\d,]+\.?\d*)',         # TOTAL: AED 123.45
-        r'TOTAL[:\s]+([\d,]+\.?\d*)',               # TOTAL: 123.45
-        r'AMOUNT[:\s]+AED\s*([\d,]+\.?\d*)',        # AMOUNT: AED 123.45
-        r'GRAND\s+TOTAL[:\s]+([\d,]+\.?\d*)',       # GRAND TOTAL: 123.45
-        r'(?:TOTAL|AMOUNT|SUM)[:\s]*\$?([\d,]+\.?\d*)', # Generic total patterns
-    ]
-
-    for pattern in total_patterns:
-        match = re.search(pattern, lines, re.IGNORECASE)
+    for pattern in _TOTAL_PATTERNS:
+        match = pattern.search(lines)
         if match:
-            # Extract the numeric value
-            total_str = match.group(1) if 'AED' in pattern else match.group(1)
             # Remove commas and ensure it's a valid number
-            total_str = total_str.replace(',', '')
+            total_str = match.group(1).replace(',', '')
             try:
                 # Validate it's a number
                 float(total_str)
@@ -178,17 +344,15 @@ def parse_fields(lines: str) -> Dict[str, Optional[str]]:
 
     # If no total found with patterns, look for largest number as fallback
     if not fields['total']:
-        # Find all numbers that look like prices
-        price_pattern = r'\b(\d+\.?\d{0,2})\b'
-        prices = re.findall(price_pattern, lines)
-        if prices:
-            # Get the largest value as likely total
-            try:
-                numeric_prices = [float(p) for p in prices if float(p) > 0]
-                if numeric_prices:
-                    fields['total'] = str(max(numeric_prices))
-            except ValueError:
-                pass
+        # Keep the largest number that looks like a price as likely total
+        best = 0.0
+        for match in _PRICE_RE.finditer(lines):
+            value = float(match.group(1))
+            if value > best:
+                best = value
+
+        if best > 0:
+            fields['total'] = str(best)
 
     return fields
 